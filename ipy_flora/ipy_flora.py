@@ -10,11 +10,14 @@ Features and Usage:
 
 * You will find an rpsimple-instance at: 
   [IPython]> IP.flora_instance
+  (XSB/Flora2 is started on first usage — or in background after
+  [IPython]> IP.flora_instance.warmup()
+  )
 * Example (more complicated than needed, but how flora-users know it):
   [IPython]> cmd = "writeln(''hello world'')@_prolog."
   [IPython]> IP.flora_instance.query(cmd)
 * For Help how to use this inspect rpsimple:
-  [IPython]> IP.flora_instance ??
+  [IPython]> IP.flora_instance.instance() ??
 
 * Magic-shortcuts help to use it more efficient
   [IPython]> ++ life:Thing
@@ -23,6 +26,14 @@ Features and Usage:
   [IPython]> ++ Everything[answer*->?X] :- ?X is 6*7
   [IPython]> ++ "answer to life, the universe and everything"(?X) :- life[answer->?X], universe[answer->?X], Everything[answer*->?X
   [IPython]> ?- "answer to life, the universe and everything"( ?TheAnswer )     // You know the result ;)
+  [IPython]> ?- ?X:Thing :: 20     // only the first 20 answers…
+  [IPython]> %flora_more           // …and the next 20
+  [IPython]> %flora_count ?X:Thing           // aggregates are calculated by the engine
+  [IPython]> %flora_sum ?A | ?_[answer->?A]   // (also %flora_min, %flora_max, %flora_avg)
+
+* Long blocks of rules/facts/queries (a string or a file) run as one batch
+  [IPython]> rules = open('rules.flr').read()
+  [IPython]> %flora_block rules
 
 * For list of all available shortcuts see:
   [IPython]> import ipy_flora
@@ -48,18 +59,71 @@ Features and Usage:
 * a more complex example can be found in ./test_and_tutorial.py
 """
 
+import sys
+import re
+
 is_identifier = lambda char: (char.isalnum() or char in ['_'])
 brackets = [('{', '}'), ('(', ')'), ('[', ']')]
 brackets_counter = lambda string: sum([string.count(br_open) - string.count(br_close) for(br_open, br_close) in brackets])
+"""quoted atoms (rpsimple-style with doubled quotes or plain) and strings"""
+quoted_regex = re.compile(r"''(?:[^']|'''')*''|'(?:[^']|'')*'|" + r'"(?:[^"\\]|\\.)*"')
+
 
+def _split_page_size_(arg):
+    """„goal :: 20“ of the magics -> (goal, limit)
+    Only the magics take this syntax — for query_advanced „?C :: 20“ is a flora-goal.
+    >>> _split_page_size_('?X:Thing :: 20'), _split_page_size_('?C::?D')
+    (('?X:Thing', 20), ('?C::?D', None))
+    """
+    match = re.match('^(?P<goal>.*)\s::\s*(?P<limit>[0-9]+)\s*$', arg, re.S)
+    if match == None:
+        return (arg, None)
+    return (match.group('goal').strip(), int(match.group('limit')))
 
 def do_flora_auto(self, arg):
     """Auto-Parse and run Flora-Commands"""
+    if arg.strip()[:2] == '?-':
+        return do_flora_query(self, arg.strip()[2:])
     return self.flora_instance.auto(arg, verbose=True)
 
 def do_flora_query(self, arg):
-    """Run Flora-Query"""
-    return self.flora_instance.query_advanced(arg, verbose=True)
+    """Run Flora-Query („goal :: 20“ returns only the first 20 answers, see %flora_more)"""
+    (goal, limit) = _split_page_size_(arg)
+    return self.flora_instance.query_advanced(goal, verbose=True, limit=limit)
+
+def do_flora_more(self, arg):
+    """Next page of the last Flora-Query with limit („?- goal :: 20“), optional argument: page-size"""
+    if arg.strip() == '':
+        return self.flora_instance.more(verbose=True)
+    return self.flora_instance.more(int(arg), verbose=True)
+
+def _flora_aggregate_(self, aggregate, arg):
+    """„?X | goal“ or just „goal“ (aggregating the first variable)"""
+    import re
+    match = re.match('^\s*(?P<var>\?[A-Za-z][a-zA-Z0-9_]*)\s*\|(?P<goal>.*)$', arg, re.S)
+    if match != None:
+        return self.flora_instance.aggregate(aggregate, match.group('goal'), match.group('var'), verbose=True)
+    return self.flora_instance.aggregate(aggregate, arg, verbose=True)
+
+def do_flora_count(self, arg):
+    """Count answers of a Flora-Query within the engine: [?X |] goal"""
+    return _flora_aggregate_(self, 'count', arg)
+
+def do_flora_sum(self, arg):
+    """Sum within the engine: [?X |] goal"""
+    return _flora_aggregate_(self, 'sum', arg)
+
+def do_flora_min(self, arg):
+    """Minimum within the engine: [?X |] goal"""
+    return _flora_aggregate_(self, 'min', arg)
+
+def do_flora_max(self, arg):
+    """Maximum within the engine: [?X |] goal"""
+    return _flora_aggregate_(self, 'max', arg)
+
+def do_flora_avg(self, arg):
+    """Average within the engine: [?X |] goal"""
+    return _flora_aggregate_(self, 'avg', arg)
 
 def do_flora_insert(self, arg):
     """Insert Flora-Fact/Rule"""
@@ -85,6 +149,106 @@ def do_flora_save(self, arg):
     from rpsimple import format_flr
     return format_flr(arg + '.flr', writeback=True)
 
+def _split_statements_(block):
+    """split a block of flora-statements at each final „.“ outside of brackets
+    >>> _split_statements_('++ p(1). q(3.5, [a. b]).\\n?- p(?X)')
+    ['++ p(1)', 'q(3.5, [a. b])', '?- p(?X)']
+    >>> _split_statements_("++ p('(' ). ++ q(a).")
+    ["++ p('(' )", '++ q(a)']
+    >>> for statement in _split_statements_("++ r(''x. )''). ++ s('y. ]'). " + '?- t("z. (")'):
+    ...     print statement
+    ++ r(''x. )'')
+    ++ s('y. ]')
+    ?- t("z. (")
+    >>> _split_statements_('++ p((1). ++ q(a).')
+    Traceback (most recent call last):
+    ...
+    AssertionError: Unbalanced brackets in: ++ p((1). ++ q(a).
+    """
+    statements = []
+    statement = ''
+    open_brackets = 0
+    idx = 0
+    while idx < len(block):
+        char = block[idx]
+        quoted = quoted_regex.match(block, idx) if char in ['"', "'"] else None
+        if quoted:
+            """brackets and dots within quotes don't count"""
+            statement += quoted.group()
+            idx = quoted.end()
+            continue
+        open_brackets += brackets_counter(char)
+        if char == '.' and open_brackets == 0 and block[idx+1:idx+2].strip() == '':
+            statements.append(statement.strip())
+            statement = ''
+        else:
+            statement += char
+        idx += 1
+    assert open_brackets == 0, 'Unbalanced brackets in: ' + block
+    statements.append(statement.strip())
+    return [statement for statement in statements if statement != '']
+
+def do_flora_block(self, arg):
+    """Run a block of Flora-Statements (++, --, ?-) as one batch
+    Argument is the name of a python-variable containing the block or a filename.
+    Consecutive inserts/deletes are sent as batches, the tables are refreshed once
+    before the queries. Returns the results of the queries."""
+    arg = arg.strip()
+    if self.user_ns.has_key(arg):
+        block = self.user_ns[arg]
+    else:
+        block = open(arg, 'r').read()
+
+    flora = self.flora_instance
+    summary = {'insert': 0, 'delete': 0, 'deleteall': 0, 'query': 0}
+    results = []
+    batch = {'action': None, 'clause_type': None, 'exprs': []}
+    modified = [True]  # refresh before the first query
+
+    def flush():
+        if batch['exprs'] != []:
+            flora.modifykb_batch(batch['exprs'], batch['action'])
+            summary[batch['action']] += len(batch['exprs'])
+            modified[0] = True
+        batch['exprs'] = []
+
+    for statement in _split_statements_(flora._uncomment_(block)):
+        if statement[:2] == '?-':
+            flush()
+            if modified[0]:
+                flora.query('abolish_all_tables.')
+                modified[0] = False
+            results.append(flora.query_advanced(statement[2:], refresh=False))
+            summary['query'] += 1
+            continue
+
+        if statement[:2] == '--':
+            statement = statement[2:]
+            action = 'delete'
+        else:
+            if statement[:2] == '++':
+                statement = statement[2:]
+            action = 'insert'
+        clause_type = (':-' in statement) and 'rule' or ''
+
+        if action == 'delete' and clause_type == '':
+            """deleteall of a pattern can't be batched"""
+            flush()
+            flora.modifykb(statement, 'deleteall')
+            summary['deleteall'] += 1
+            modified[0] = True
+        else:
+            if (action, clause_type) != (batch['action'], batch['clause_type']):
+                flush()
+                batch['action'] = action
+                batch['clause_type'] = clause_type
+            batch['exprs'].append(statement)
+    flush()
+
+    print '[block: %(insert)d inserted, %(delete)d deleted, %(deleteall)d deletedall, %(query)d queries]' % summary
+    if results != []:
+        return results
+
 def do_flora_completer_update(self, arg):
     """Update the tab-completer — load a file with known tokens / compound functions"""
     from rpsimple import format_flr
@@ -250,18 +414,139 @@ def completer_flora(self, event, debug=False):
             result += [_parseEnd_(match)]
     return result
 
-def init_ipython(ip):
-    """Initialize the Extension when IPython is loaded"""
-    import rpsimple
-    ip.IP.flora_instance = rpsimple.Flora2()
+class LazyFlora2(object):
+    """Proxy for rpsimple.Flora2, booting XSB/Flora2 not before it is needed
+    Importing rpsimple (and so rp) starts the engine. This is deferred till the
+    first attribute access — which happens with the first magic or completion.
+    Help about the engine itself: IP.flora_instance.instance() ??
+
+    >>> lazy = LazyFlora2(factory=lambda: 'engine')
+    >>> lazy.started()
+    False
+    >>> lazy.upper()
+    'ENGINE'
+    >>> lazy.started()
+    True
+
+    Optionally the engine is started in background (warmup), so it is ready by the
+    time the user types. Then the engine is used only from this „flora_engine“-thread:
+    all method-calls are forwarded to it.
+
+    >>> import threading
+    >>> class Engine(object):
+    ...     def thread(self):
+    ...         return threading.currentThread().getName()
+    >>> lazy = LazyFlora2(factory=Engine, warmup=True)
+    >>> lazy.thread()
+    'flora_engine'
+
+    Limitation: rp boots XSB/Flora2 while being imported. During the warmup the
+    worker holds python's import-lock, so imports of the main-thread (e.g. of
+    modules not imported before) wait till the engine is up.
+    """
+
+    def __init__(self, factory=None, warmup=False):
+        import threading
+        self._factory_ = factory
+        self._instance_ = None
+        self._lock_ = threading.Lock()
+        self._calls_ = None  # queue of the engine-thread (only after warmup)
+        if warmup:
+            self.warmup()
+
+    def _create_(self):
+        if self._factory_ == None:
+            import rpsimple
+            self._factory_ = rpsimple.Flora2
+        self._instance_ = self._factory_()
+
+    def _get_instance_(self):
+        """create the instance (only once, even when called from several threads)"""
+        self._lock_.acquire()
+        try:
+            if self._instance_ == None:
+                self._create_()
+        finally:
+            self._lock_.release()
+        return self._instance_
+
+    def instance(self):
+        """the rpsimple.Flora2-instance (started if needed)"""
+        return self._get_instance_()
+
+    def warmup(self):
+        """start the engine in a background-thread, which runs all later calls"""
+        import threading, Queue
+        if self._calls_ != None or self.started():
+            return
+        self._calls_ = Queue.Queue()
+        self._lock_.acquire()  # released by the engine-thread when the instance exists
+        thread = threading.Thread(target=self._engine_thread_, name='flora_engine')
+        thread.setDaemon(True)
+        thread.start()
+        return thread
+
+    def _engine_thread_(self):
+        try:
+            self._create_()
+        except:
+            self._calls_ = None  # the main-thread tries again (and gets the error)
+            self._lock_.release()
+            return
+        self._lock_.release()
+        while True:
+            (func, args, kwargs, reply) = self._calls_.get()
+            try:
+                reply.put((True, func(*args, **kwargs)))
+            except:
+                reply.put((False, sys.exc_info()))
+
+    def _call_in_engine_thread_(self, func, args, kwargs):
+        import Queue
+        reply = Queue.Queue()
+        self._calls_.put((func, args, kwargs, reply))
+        (ok, value) = reply.get(True, 10**9)  # with timeout to stay interruptible
+        if not ok:
+            raise value[0], value[1], value[2]
+        return value
+
+    def started(self):
+        """True when the engine is already running"""
+        return self._instance_ != None
+
+    def __getattr__(self, name):
+        attr = getattr(self._get_instance_(), name)
+        if self._calls_ == None or not callable(attr):
+            return attr
+        return lambda *args, **kwargs: self._call_in_engine_thread_(attr, args, kwargs)
+
+    def __repr__(self):
+        if self.started():
+            return '<LazyFlora2 ' + repr(self._instance_) + '>'
+        return '<LazyFlora2 (not started)>'
+
+def init_ipython(ip, warmup=False):
+    """Initialize the Extension when IPython is loaded
+    The engine is started lazily (see LazyFlora2) — or in background when „warmup“ is set:
+      ip.load('ipy_flora.ipy_flora')
+      ip.IP.flora_instance.warmup()
+    """
+    ip.IP.flora_instance = LazyFlora2(warmup=warmup)
 
     ip.expose_magic('flora', do_flora_auto)
     ip.expose_magic('?-', do_flora_query)
+    ip.expose_magic('flora_more', do_flora_more)
+    ip.expose_magic('flora_count', do_flora_count)
+    ip.expose_magic('flora_sum', do_flora_sum)
+    ip.expose_magic('flora_min', do_flora_min)
+    ip.expose_magic('flora_max', do_flora_max)
+    ip.expose_magic('flora_avg', do_flora_avg)
     ip.expose_magic('++', do_flora_insert)
     ip.expose_magic('--', do_flora_delete)
     ip.expose_magic('flora_abolish_all_tables', do_flora_abolish_all_tables)
     ip.expose_magic('flora_pprint', do_flora_pprint)
     ip.expose_magic('flora_save', do_flora_save)
+    ip.expose_magic('flora_block', do_flora_block)
     ip.expose_magic('flora_completer_update', do_flora_completer_update)
     ip.set_hook('complete_command', completer_flora, re_key = '^(?!%flora[^ ]*$).*flora.*')
     ip.set_hook('complete_command', completer_flora, re_key = '^(\?-|\+\+|--).*')
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+disk-cache for results of Flora2.query_advanced
+
+Batch-jobs consulting the same files and running the same expensive queries
+get the answers without any work of the engine:
+
+  [python]> f = rpsimple.Flora2()
+  [python]> f.use_query_cache('queries.sqlite', maxbytes=50*2**20)
+  [python]> f.consult_dir('kb')
+  [python]> f.query_advanced('expensive(?X)')   # second run: from cache
+
+The keys are hashes of Flora2.kb_hash (content of the consulted files and the
+modifications done by modifykb) + the query (see rpsimple.normalize_whitespace)
++ its options.
+Entries are pickled into a sqlite-database, which is limited to maxbytes
+by removing the least recently used entries.
+
+>>> import tempfile
+>>> filename = tempfile.mktemp('.sqlite')
+>>> cache = QueryCache(filename, maxbytes=150)
+>>> key = cache.key('kb', 'p(?X).', ['X'])
+>>> cache.get(key) == None
+True
+>>> cache.put(key, ['23', '42'])
+>>> cache.get(key)
+['23', '42']
+>>> for nr in range(10):
+...     cache.put(cache.key('kb', 'q(' + str(nr) + ').'), ['x' * 20])
+...     dummy = cache.get(key)  # keep p(?X) recently used
+>>> len(cache) < 11, cache.size() <= 150, cache.get(key)
+(True, True, ['23', '42'])
+>>> cache.get(cache.key('kb', 'q(0).')) == None
+True
+>>> cache.clear(); len(cache)
+0
+>>> cache.close(); os.remove(filename)
+"""
+
+import doctest
+import sqlite3
+import cPickle
+import hashlib
+import sys
+import os
+
+class QueryCache(object):
+    """sqlite-database of pickled results with LRU-eviction"""
+
+    def __init__(self, filename, maxbytes=100*2**20):
+        self.maxbytes = maxbytes
+        self.db = sqlite3.connect(filename)
+        self.db.execute('CREATE TABLE IF NOT EXISTS results '
+                        '(key TEXT PRIMARY KEY, value BLOB, size INTEGER, used INTEGER)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+        self.db.commit()
+        self.clock = self.db.execute('SELECT COALESCE(MAX(used), 0) FROM results').fetchone()[0]
+
+    def key(self, *parts):
+        """hash of everything the result depends on"""
+        return hashlib.sha1(repr(parts)).hexdigest()
+
+    def _tick_(self):
+        self.clock += 1
+        return self.clock
+
+    def get(self, key):
+        """cached result — or None"""
+        row = self.db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row == None:
+            return None
+        self.db.execute('UPDATE results SET used = ? WHERE key = ?', (self._tick_(), key))
+        self.db.commit()
+        return cPickle.loads(str(row[0]))
+
+    def put(self, key, result):
+        value = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+        if len(value) > self.maxbytes:
+            return
+        self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', \
+                        (key, sqlite3.Binary(value), len(value), self._tick_()))
+        self._evict_()
+        self.db.commit()
+
+    def _evict_(self):
+        """remove least recently used entries till the size fits"""
+        size = self.size()
+        while size > self.maxbytes:
+            (key, entry_size) = self.db.execute('SELECT key, size FROM results ORDER BY used LIMIT 1').fetchone()
+            self.db.execute('DELETE FROM results WHERE key = ?', (key,))
+            size -= entry_size
+
+    def size(self):
+        """bytes of all cached results"""
+        return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def clear(self):
+        self.db.execute('DELETE FROM results')
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == '__main__':
+    result = doctest.testmod()
+    print result
+    sys.exit(result.failed)
@@ -0,0 +1,313 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+shared Flora2-engine, reachable over a local unix-socket
+
+Starting XSB/Flora2 and consulting a big knowledge-base takes time and memory.
+The daemon holds one rpsimple.Flora2 with the kb loaded, sessions connect to it:
+
+  $ ./rpdaemon.py /tmp/flora.sock kb_dir/ other_file.flr
+
+  [python]> f = Flora2Client('/tmp/flora.sock')
+  [python]> f.auto('?- q(?Y)', verbose=True)
+
+Protocol:
+* each message is a frame: 4 bytes length (network byte order) + marshaled payload
+* request:  (request_id, method, args, kwargs)
+* response: (request_id, ok, value_or_error, printed_output)
+* Terms and ResultTables within payloads are sent as tagged tuples:
+  ('\\0Term', functor, args) and ('\\0ResultTable', header, rows)
+* requests can be pipelined — send several and receive the responses later
+* the engine is shared, so requests of all connections are run one after another
+* results are paged by the client (limit, more), so each connection has its own pages
+
+Test with a stand-in instead of Flora2:
+
+>>> class Echo:
+...     def auto(self, expr, verbose=False):
+...         if verbose:
+...             print '[echo]'
+...         return [expr]
+...     def query_advanced(self, expr, varlist=None, *args, **kwargs):
+...         return [expr + str(nr) for nr in range(3)]
+...     def modifykb(self, expr, action=None):
+...         return action
+...     def consult(self, filename, add=False, module='main'):
+...         return (os.path.basename(filename), add, module)
+>>> import tempfile
+>>> socketpath = tempfile.mktemp('.sock')
+>>> daemon = FloraDaemon(socketpath, Echo())
+>>> thread = daemon.serve_in_background()
+>>> client = Flora2Client(socketpath)
+>>> client.auto('p(23)', verbose=True)
+[echo]
+['p(23)']
+>>> ids = [client.send('auto', 'p(' + str(nr) + ')') for nr in range(3)]
+>>> [client.receive(request_id) for request_id in reversed(ids)]
+[['p(2)'], ['p(1)'], ['p(0)']]
+>>> result = client.auto(Term('f', ['a', ResultTable(['A'], [(1,), (Term('g', []),)])]))
+>>> result
+[Term('f', ('a', ResultTable(['A'], 2 rows)))]
+>>> result[0].args[1].rows
+[(1,), (Term('g', ()),)]
+>>> other = Flora2Client(socketpath)
+>>> client.query_advanced('n(?N)', limit=2), other.query_advanced('m(?M)', limit=1)
+(['n(?N)0', 'n(?N)1'], ['m(?M)0'])
+>>> client.more(), other.more()
+(['n(?N)2'], ['m(?M)1'])
+>>> other.close()
+>>> client.query_advanced('n(?N)', ['N']), client.modifykb('p(1)', 'insert'), client.consult('x.flr', True)
+(['n(?N)0', 'n(?N)1', 'n(?N)2'], 'insert', ('x.flr', True, 'main'))
+>>> client.query('p(?X).')
+Traceback (most recent call last):
+...
+RemoteError: AttributeError: Echo instance has no attribute 'query'
+>>> client.send('__init__')
+Traceback (most recent call last):
+...
+AssertionError: Method not allowed: __init__
+>>> client.close()
+>>> daemon.shutdown()
+"""
+
+import doctest
+import SocketServer
+import socket
+import marshal
+import struct
+import threading
+import StringIO
+import sys
+import os
+from rpterms import Term, ResultTable, Pager, _result_table_
+
+ALLOWED_METHODS = ['query', 'query_advanced', 'modifykb', 'modifykb_batch', 'sync_facts', 'auto', \
+                   'consult', 'consult_dir', 'aggregate', 'count', 'sum', 'min', 'max', 'avg', 'group_by']
+
+class RemoteError(Exception):
+    """Exception raised within the daemon"""
+
+"""exceptions re-raised with their own type at the client"""
+REMOTE_BUILTIN_ERRORS = {'AssertionError': AssertionError, 'NotImplementedError': NotImplementedError}
+
+def _encode_(value):
+    """replace objects marshal can't encode by tagged tuples"""
+    if isinstance(value, Term):
+        return ('\0Term', _encode_(value.functor), tuple([_encode_(arg) for arg in value.args]))
+    elif isinstance(value, ResultTable):
+        return ('\0ResultTable', value.header, [_encode_(row) for row in value.rows])
+    elif type(value) in [type([]), type(())]:
+        return type(value)([_encode_(item) for item in value])
+    elif type(value) == type({}):
+        return dict([(_encode_(key), _encode_(item)) for (key, item) in value.items()])
+    return value
+
+def _decode_(value):
+    """inverse of _encode_"""
+    if type(value) == type(()):
+        if len(value) == 3 and value[0] == '\0Term':
+            return Term(_decode_(value[1]), [_decode_(arg) for arg in value[2]])
+        elif len(value) == 3 and value[0] == '\0ResultTable':
+            return _result_table_(value[1], [_decode_(row) for row in value[2]])
+        return tuple([_decode_(item) for item in value])
+    elif type(value) == type([]):
+        return [_decode_(item) for item in value]
+    elif type(value) == type({}):
+        return dict([(_decode_(key), _decode_(item)) for (key, item) in value.items()])
+    return value
+
+def _send_frame_(sock, payload):
+    data = marshal.dumps(_encode_(payload))
+    sock.sendall(struct.pack('!I', len(data)) + data)
+
+def _recv_exactly_(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if chunk == '':
+            raise EOFError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+def _recv_frame_(sock):
+    (size,) = struct.unpack('!I', _recv_exactly_(sock, 4))
+    return _decode_(marshal.loads(_recv_exactly_(sock, size)))
+
+
+class _RequestHandler_(SocketServer.BaseRequestHandler):
+    """handles one connection: answers requests in the order they arrive"""
+
+    def handle(self):
+        while True:
+            try:
+                (request_id, method, args, kwargs) = _recv_frame_(self.request)
+            except EOFError:
+                return
+            (ok, value, output) = self.server.run(method, args, kwargs)
+            try:
+                _send_frame_(self.request, (request_id, ok, value, output))
+            except ValueError, e:
+                """result contains other objects marshal can't encode"""
+                _send_frame_(self.request, (request_id, False, ('ValueError', str(e)), output))
+
+
+class FloraDaemon(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """serves one Flora2-instance to all clients connecting to socketpath"""
+
+    daemon_threads = True
+
+    def __init__(self, socketpath, flora):
+        if os.path.exists(socketpath):
+            os.remove(socketpath)
+        SocketServer.UnixStreamServer.__init__(self, socketpath, _RequestHandler_)
+        os.chmod(socketpath, 0600)
+        self.socketpath = socketpath
+        self.flora = flora
+        self.engine_lock = threading.Lock()
+
+    def run(self, method, args, kwargs):
+        """run method on the engine, returns (ok, value_or_error, printed_output)"""
+        self.engine_lock.acquire()
+        stdout = sys.stdout
+        sys.stdout = output = StringIO.StringIO()
+        try:
+            try:
+                assert method in ALLOWED_METHODS, 'Method not allowed: ' + method
+                return (True, getattr(self.flora, method)(*args, **kwargs), output.getvalue())
+            except Exception, e:
+                return (False, (e.__class__.__name__, str(e)), output.getvalue())
+        finally:
+            sys.stdout = stdout
+            self.engine_lock.release()
+
+    def serve_in_background(self):
+        thread = threading.Thread(target=self.serve_forever, name='flora_daemon')
+        thread.setDaemon(True)
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        SocketServer.UnixStreamServer.shutdown(self)
+        self.server_close()
+        os.remove(self.socketpath)
+
+
+class Flora2Client(Pager):
+    """same API as rpsimple.Flora2 (query, query_advanced, modifykb, auto, …),
+    but using the engine of a FloraDaemon"""
+
+    def __init__(self, socketpath):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socketpath)
+        self.next_id = 0
+        self.pending = {}  # responses received while waiting for another request
+
+    def send(self, method, *args, **kwargs):
+        """send a request without waiting for the response — returns the request_id"""
+        assert method in ALLOWED_METHODS, 'Method not allowed: ' + method
+        request_id = self.next_id
+        self.next_id += 1
+        _send_frame_(self.sock, (request_id, method, args, kwargs))
+        return request_id
+
+    def receive(self, request_id):
+        """wait for the response of a request sent before"""
+        while request_id not in self.pending:
+            response = _recv_frame_(self.sock)
+            self.pending[response[0]] = response[1:]
+        (ok, value, output) = self.pending.pop(request_id)
+        if output != '':
+            sys.stdout.write(output)
+        if not ok:
+            (name, message) = value
+            if name in REMOTE_BUILTIN_ERRORS:
+                raise REMOTE_BUILTIN_ERRORS[name](message)
+            raise RemoteError(name + ': ' + message)
+        return value
+
+    def _call_(self, method, *args, **kwargs):
+        return self.receive(self.send(method, *args, **kwargs))
+
+    def query(self, expr, varlist=[]):
+        return self._call_('query', expr, varlist)
+
+    def query_advanced(self, expr, varlist=None, verbose=False, vverbose=False, \
+                       formatResult=True, getTypeOf=[], convertTypeOf=[], decodeTermsOf=[], refresh=True, \
+                       limit=None, offset=0, compact=False):
+        """all answers are sent, the pages are kept here for more()"""
+        result = self._call_('query_advanced', expr, varlist, verbose, vverbose, formatResult, getTypeOf, \
+                             convertTypeOf, decodeTermsOf, refresh, compact=compact)
+        if not formatResult:
+            return result
+        return self._page_(result, limit, offset, verbose or vverbose)
+
+    def aggregate(self, aggregate, goal, var=None, by=None, **kwargs):
+        return self._call_('aggregate', aggregate, goal, var, by, **kwargs)
+
+    def count(self, goal, var=None, **kwargs):
+        return self.aggregate('count', goal, var, **kwargs)
+
+    def sum(self, goal, var=None, **kwargs):
+        return self.aggregate('sum', goal, var, **kwargs)
+
+    def min(self, goal, var=None, **kwargs):
+        return self.aggregate('min', goal, var, **kwargs)
+
+    def max(self, goal, var=None, **kwargs):
+        return self.aggregate('max', goal, var, **kwargs)
+
+    def avg(self, goal, var=None, **kwargs):
+        return self.aggregate('avg', goal, var, **kwargs)
+
+    def group_by(self, goal, by, var=None, aggregate='count', **kwargs):
+        return self.aggregate(aggregate, goal, var, by, **kwargs)
+
+    def modifykb(self, expr, action=None, **kwargs):
+        return self._call_('modifykb', expr, action, **kwargs)
+
+    def modifykb_batch(self, exprs, action='insert', **kwargs):
+        return self._call_('modifykb_batch', list(exprs), action, **kwargs)
+
+    def sync_facts(self, pattern, desired, **kwargs):
+        return self._call_('sync_facts', pattern, list(desired), **kwargs)
+
+    def auto(self, expr, limit=None, offset=0, **kwargs):
+        return self._page_(self._call_('auto', expr, **kwargs), limit, offset, \
+                           kwargs.get('verbose') or kwargs.get('vverbose'))
+
+    def consult(self, filename, add=False, module='main'):
+        return self._call_('consult', os.path.abspath(filename), add, module)
+
+    def consult_dir(self, dirname, add=True, **kwargs):
+        return self._call_('consult_dir', os.path.abspath(dirname), add, **kwargs)
+
+    def close(self):
+        self.sock.close()
+
+
+def main(socketpath, *kb):
+    """start a daemon with all files/dirs of kb consulted"""
+    import rpsimple
+    flora = rpsimple.Flora2()
+    add = False
+    for path in kb:
+        if os.path.isdir(path):
+            flora.consult_dir(path, add=add)
+        else:
+            flora.consult(os.path.abspath(path), add=add)
+        add = True
+    daemon = FloraDaemon(socketpath, flora)
+    print '[listening on ' + socketpath + ']'
+    try:
+        daemon.serve_forever()
+    finally:
+        os.remove(socketpath)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(*sys.argv[1:])
+    else:
+        result = doctest.testmod()
+        print result
+        sys.exit(result.failed)
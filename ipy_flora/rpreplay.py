@@ -0,0 +1,171 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+record engine-calls of real sessions and replay them without XSB/Flora2
+
+Record (needs the full installation):
+  [python]> f = RecordingFlora2('session.rec')
+  [python]> f.auto('?- p(?X)')       # every call of Flora2.query is logged
+  [python]> f.recording.close()
+
+Replay (only needs python) — the answers come from the file, so the time spent
+is the python-side overhead of query_advanced, format_result, format_flr, …:
+  [python]> f = ReplayFlora2('session.rec')
+  [python]> f.measure(f.auto, '?- p(?X)')
+
+The file is a gzip-compressed stream of frames: 4 bytes length + marshaled
+(expr, varlist, result, seconds, files). files are the contents of files written
+by the engine-call (like „_save(completion).“), replaying writes them again.
+
+>>> import tempfile
+>>> filename = tempfile.mktemp('.rec')
+>>> recording = RecordFile(filename, 'w')
+>>> recording.write('refresh{p(?X)}.', [], [{}], 0.01)
+>>> recording.write('p(?X).', ['X'], [{'X': '23'}, {'X': '42'}], 0.5)
+>>> recording.close()
+>>> f = ReplayFlora2(filename)
+>>> f.auto('?- p(?X)', convertTypeOf=['X'])
+[23, 42]
+>>> f.calls, f.engine_seconds
+(2, 0.51)
+>>> (result, python_seconds, engine_seconds) = f.measure(f.auto, '?- p(?X)')
+>>> result, engine_seconds
+(['23', '42'], 0.51)
+>>> f.query('q(?Y).', ['Y'])
+Traceback (most recent call last):
+...
+NotRecorded: ('q(?Y).', ['Y'])
+>>> f.py2f([1, 2.5])
+'[1, 2.5]'
+>>> os.remove(filename)
+
+>>> recording = RecordFile(filename, 'w')
+>>> recording.write('_save(completion).', [], [{}], 0.2, {'completion.flr': 'p(1).\\n'})
+>>> recording.write('s(?X).', ['X'], [{'X': "it's"}, {'X': 'f(1)'}], 0.1)
+>>> recording.close()
+>>> f = ReplayFlora2(filename)
+>>> f.query_advanced('s(?X)', decodeTermsOf=['X'], refresh=False)
+[Term('f', (1,)), "it's"]
+>>> cache = f.use_query_cache(filename + '.sqlite')
+>>> [f.query_advanced('s(?X)', formatResult=False, limit=1, refresh=False) for nr in range(2)]
+[([{'X': "it's"}, {'X': 'f(1)'}], ['X']), ([{'X': "it's"}, {'X': 'f(1)'}], ['X'])]
+>>> cache.close(); os.remove(filename + '.sqlite')
+>>> f.query('_save(completion).')
+[{}]
+>>> rpsimple.format_flr('completion.flr')
+['p(1).']
+>>> os.remove('completion.flr'); os.remove(filename)
+"""
+
+import doctest
+import rpsimple
+import marshal
+import re
+import struct
+import gzip
+import time
+import sys
+import os
+
+class NotRecorded(LookupError):
+    """Exception: the replayed session contains no such engine-call"""
+
+
+class RecordFile(object):
+    """file of recorded engine-calls"""
+
+    def __init__(self, filename, mode='r'):
+        assert mode in ['r', 'w', 'a'], 'Mode not allowed: ' + mode
+        self.fd = gzip.open(filename, mode + 'b')
+
+    def write(self, expr, varlist, result, seconds, files={}):
+        data = marshal.dumps((expr, list(varlist), result, seconds, dict(files)))
+        self.fd.write(struct.pack('!I', len(data)) + data)
+
+    def __iter__(self):
+        while True:
+            header = self.fd.read(4)
+            if len(header) < 4:
+                return
+            (size,) = struct.unpack('!I', header)
+            frame = marshal.loads(self.fd.read(size))
+            if len(frame) == 4:
+                """recorded before files were recorded"""
+                frame += ({},)
+            yield frame
+
+    def close(self):
+        self.fd.close()
+
+
+class RecordingFlora2(rpsimple.Flora2):
+    """Flora2 logging every engine-call with its result and duration"""
+
+    def __init__(self, filename, *args, **kwargs):
+        rpsimple.Flora2.__init__(self, *args, **kwargs)
+        self.recording = RecordFile(filename, 'a')
+
+    def query(self, expr, varlist=[]):
+        start = time.time()
+        result = rpsimple.Flora2.query(self, expr, varlist)
+        seconds = time.time() - start
+        files = {}
+        match = re.match('^\s*_save\((?P<name>[^)]*)\)\s*\.$', expr)
+        if match != None:
+            filename = match.group('name').strip() + '.flr'
+            files[filename] = open(filename, 'r').read()
+        self.recording.write(expr, varlist, result, seconds, files)
+        return result
+
+
+class ReplayFlora2(rpsimple.Flora2):
+    """stand-in for Flora2 answering engine-calls from a recorded session
+    Each call gets the answers recorded for it in the same order — when called
+    more often than recorded, the last answer is repeated."""
+
+    def __init__(self, filename):
+        self._setup_()
+        self.recorded = {}
+        for (expr, varlist, result, seconds, files) in RecordFile(filename):
+            self.recorded.setdefault((expr, tuple(varlist)), []).append((result, seconds, files))
+        self.replayed = {}
+        self.calls = 0
+        self.engine_seconds = 0.0
+
+    def query(self, expr, varlist=[]):
+        key = (expr, tuple(varlist))
+        if key not in self.recorded:
+            raise NotRecorded(expr, list(varlist))
+        answers = self.recorded[key]
+        nr = self.replayed.get(key, 0)
+        self.replayed[key] = nr + 1
+        (result, seconds, files) = answers[min(nr, len(answers) - 1)]
+        self.calls += 1
+        self.engine_seconds += seconds
+        for (filename, content) in files.items():
+            fd = open(filename, 'w')
+            fd.write(content)
+            fd.close()
+        """copy, since format_result modifies the answers"""
+        if type(result) == type([]):
+            return [dict(answer) if type(answer) == type({}) else answer for answer in result]
+        return result
+
+    def measure(self, func, *args, **kwargs):
+        """run func, returns (result, python_seconds, recorded engine_seconds of its calls)"""
+        engine_seconds = self.engine_seconds
+        start = time.time()
+        result = func(*args, **kwargs)
+        return (result, time.time() - start, self.engine_seconds - engine_seconds)
+
+    def rewind(self):
+        """start replaying the recorded answers from the beginning"""
+        self.replayed = {}
+        self.calls = 0
+        self.engine_seconds = 0.0
+
+
+if __name__ == '__main__':
+    result = doctest.testmod()
+    print result
+    sys.exit(result.failed)
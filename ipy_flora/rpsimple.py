@@ -38,30 +38,71 @@ str: object
 str: single quoted => object
 str: „special“ chars
 …
+>>> f.auto('r([f(a, 1), [2, 3.5]])')
+>>> f.query_advanced('r(?X)', decodeTermsOf=['X'])
+[[Term('f', ('a', 1)), [2, 3.5]]]
+>>> f.query_advanced('q(?X)', convertTypeOf=['X'], decodeTermsOf=['X'])
+[23, 42]
+>>> f.auto('++ n(1)'); f.auto('++ n(2)'); f.auto('++ n(3)')
+>>> f.auto('?- n(?N)', limit=2, verbose=True)
+[refresh: n(?N)]
+[query for ['N']]
+[answers 0-2 of 3]
+['1', '2']
+>>> f.more()
+['3']
+>>> f.more()
+[]
 """
 
 import doctest
-import rp
 import re
 import itertools
 import sys
 import os
+from rpterms import Term, ResultTable, _result_table_, Pager, parse_term, quote_term, guess_type_of_literal
+
+try:
+    import rp
+    _Engine_ = rp.interface.Flora2
+except ImportError:
+    """without ReasonablePy only recorded sessions can be replayed (see rpreplay)"""
+    rp = None
+    class _Engine_(object):
+        def __init__(self, *args, **kwargs):
+            raise ImportError('ReasonablePy (rp) is needed to start XSB/Flora2 — see INSTALL')
+
+class Flora2(_Engine_, Pager):
+
+    query_cache = None  # optional disk-cache of query_advanced results (see use_query_cache)
+    kb_hash = ''        # hash of everything consulted/modified, part of the keys of query_cache
+
+    def __init__(self, *args, **kwargs):
+        _Engine_.__init__(self, *args, **kwargs)
+        self._setup_()
 
-class Flora2(rp.interface.Flora2):
+    def _setup_(self):
+        """python-side state — also used by stand-ins without engine (see rpreplay)"""
+        self.type_cache = {}  # constant -> kind of python-type (see format_result), cleared on kb-changes
 
     def query(self, expr, varlist=[]):
         """default empty varlist"""
-        return rp.interface.Flora2.query(self, expr, varlist)
+        return _Engine_.query(self, expr, varlist)
 
     def query_advanced(self, expr, varlist=None, verbose=False, vverbose=False, \
-                       formatResult=True, getTypeOf=[], convertTypeOf=[]):
-        """advanced version of query"""
+                       formatResult=True, getTypeOf=[], convertTypeOf=[], decodeTermsOf=[], refresh=True, \
+                       limit=None, offset=0, compact=False):
+        """advanced version of query
+        refresh=False skips refreshing the tables (e.g. when they were abolished just before)
+        limit/offset return only a page of the answers (the magics take „?- goal :: 20“),
+        the following pages are returned by more()
+        compact=True returns a ResultTable (shared header, rows as tuples) instead of a list of dicts —
+        it saves memory for keeping the result, but rp still builds all answers as dicts before
+        With a query_cache the results are looked up by kb_hash and the normalized query first."""
 
         if vverbose:
             verbose = True
 
-        getTypeOf = set(getTypeOf + convertTypeOf[:1])  # Till now only for one item implemented
-
         """calculate varlist"""
 
         if varlist == None:
@@ -81,23 +122,38 @@ class Flora2(rp.interface.Flora2):
         expr += '.'
         assert re.match('^[^{]*:-[^}]*$', expr) == None, '„:-“ only within allowed „{ }“ allowed'
 
-        """refresh (against problems with tabling)"""
+        """lookup in query_cache"""
 
-        unrefreshable_expr = (True in [test in expr for test in ['{', '}', '@', '\\', '<']]) or \
-                             re.match('.*[^-]>.*', expr) != None or \
-                             re.match('.*:=:.*', expr) != None or \
-                             re.match('.*not .*', expr) != None
-        if unrefreshable_expr:
-            """this case could be improved in future: parse the compound and refresh all it's parts"""
-            if verbose:
-                print '[unrefreshable]'
-        else:
+        cache_key = None
+        if self.query_cache != None:
+            cache_key = self.query_cache.key(self.kb_hash, normalize_whitespace(expr), varlist, formatResult, \
+                                             getTypeOf, convertTypeOf, decodeTermsOf, compact)
+            cached = self.query_cache.get(cache_key)
+            if cached != None:
+                if verbose:
+                    print '[cached]'
+                if not formatResult:
+                    """not paged — like without cache"""
+                    return cached
+                return self._page_(cached, limit, offset, verbose)
+
+        """refresh (against problems with tabling) — unless the caller takes care (e.g. abolished all tables before)"""
+
+        if refresh:
+            self._refresh_(expr[:-1], verbose)
+
+        """plain query — types of the answers by their syntax, type_cache or one query for the unknown constants"""
+
+        if len(convertTypeOf) == 1 and getTypeOf == [] and formatResult:
             if verbose:
-                print '[refresh: ' + expr[:-1] + ']'
-            self.query('refresh{' + expr[:-1] + '}.')
+                print '[query for ' + str(varlist) + ']'
+            result = self._convert_known_types_(self.query(expr, varlist), convertTypeOf[0], verbose)
+            return self._cache_and_page_(self.format_result(result, varlist, [], decodeTermsOf, compact), \
+                                         cache_key, limit, offset, verbose)
 
         """expand query — get types of a variable"""
 
+        getTypeOf = set(getTypeOf + convertTypeOf[:1])  # Till now only for one item implemented
         if len(getTypeOf) > 1:
             raise NotImplementedError
         for var in getTypeOf:
@@ -117,33 +173,81 @@ class Flora2(rp.interface.Flora2):
 
         if not formatResult:
             """a stable format"""
-            return (result, varlist)
-        return self.format_result(result, varlist, convertTypeOf)
+            return self._cache_and_page_((result, varlist), cache_key, None, 0, verbose)
+        return self._cache_and_page_(self.format_result(result, varlist, convertTypeOf, decodeTermsOf, compact), \
+                                     cache_key, limit, offset, verbose)
+
+    def _refresh_(self, goal, verbose=False):
+        """refresh the tables of goal (without final „.“) — if it can be refreshed"""
+        unrefreshable_expr = (True in [test in goal for test in ['{', '}', '@', '\\', '<']]) or \
+                             re.match('.*[^-]>.*', goal) != None or \
+                             re.match('.*:=:.*', goal) != None or \
+                             re.match('.*not .*', goal) != None
+        if unrefreshable_expr:
+            """this case could be improved in future: parse the compound and refresh all it's parts"""
+            if verbose:
+                print '[unrefreshable]'
+        else:
+            if verbose:
+                print '[refresh: ' + goal + ']'
+            self.query('refresh{' + goal + '}.')
+
+    def _cache_and_page_(self, result, cache_key, limit, offset, verbose=False):
+        if cache_key != None:
+            self.query_cache.put(cache_key, result)
+        return self._page_(result, limit, offset, verbose)
+
+    def use_query_cache(self, filename, maxbytes=100*2**20):
+        """keep results of query_advanced in a disk-cache (see rpcache), valid as long as the same
+        files are consulted and the same modifications (modifykb) are done.
+        Changes of the knowledge-base by plain query() calls (e.g. „insert{…}.“) are not noticed!
+        >>> import tempfile
+        >>> f = Flora2()
+        >>> filename = tempfile.mktemp('.sqlite')
+        >>> cache = f.use_query_cache(filename)
+        >>> f.auto('++ cached_p(1)')
+        >>> f.query_advanced('cached_p(?X)', verbose=True)
+        [refresh: cached_p(?X)]
+        [query for ['X']]
+        ['1']
+        >>> f.query_advanced('cached_p(?X)', verbose=True)
+        [cached]
+        ['1']
+        >>> f.auto('++ cached_p(2)')
+        >>> f.query_advanced('cached_p(?X)', verbose=True)
+        [refresh: cached_p(?X)]
+        [query for ['X']]
+        ['1', '2']
+        >>> cache.close(); f.query_cache = None; os.remove(filename)
+        """
+        import rpcache
+        self.query_cache = rpcache.QueryCache(filename, maxbytes)
+        return self.query_cache
 
-    def format_result(self, result, varlist, convertTypeOf=[]):
-        """convert flora-results to more pythonic types"""
+    def _update_kb_hash_(self, *changes):
+        import hashlib
+        self.kb_hash = hashlib.sha1(repr((self.kb_hash,) + changes)).hexdigest()
+
+    def format_result(self, result, varlist, convertTypeOf=[], decodeTermsOf=[], compact=False):
+        """convert flora-results to more pythonic types
+        convertTypeOf: cast by the types flora knows about the answers
+        decodeTermsOf: parse the answers recursively (see parse_term)
+        compact: return a ResultTable instead of a list of dicts for several vars"""
 
         """convert selected vars within result"""
         for var in convertTypeOf:
             for answer_count in range(len(result)):
                 answer_dict = result[answer_count]
-
-                if '_integer' in answer_dict['Types' + var]:
-                    answer_dict[var] = int(answer_dict[var])
-                elif '_decimal' in answer_dict['Types' + var]:
-                    answer_dict[var] = float(answer_dict[var])
-                elif '_none' in answer_dict['Types' + var]:
-                    answer_dict[var] = None
-                elif '_escaped' in answer_dict['Types' + var]:
-                    answer_dict[var] = self.unescape(answer_dict[var])
-                elif '_list' in answer_dict['Types' + var] \
-                and answer_dict[var][0] == '[' and answer_dict[var][-1] == ']':
-                    answer_dict[var] = str2list(answer_dict[var])
-                    # content of list is not casted now
-
-                answer_dict.pop('Types' + var)
+                kind = self._kind_of_types_(answer_dict[var], answer_dict.pop('Types' + var))
+                self._cache_type_(answer_dict[var], kind)
+                answer_dict[var] = self._convert_kind_(answer_dict[var], kind)
             varlist.remove('Types' + var)
 
+        """decode selected vars into nested lists/tuples/Terms"""
+        for var in decodeTermsOf:
+            for answer_dict in result:
+                answer_dict[var] = parse_term(answer_dict[var], strict=False)
+
         """returns Boolean, List or ListOfDict depending on number of vars"""
         if varlist == []:
             if result == [{}]:
@@ -155,15 +259,95 @@ class Flora2(rp.interface.Flora2):
             var = varlist[0]
             result = sorted(result)
             return [k[var] for k,v in itertools.groupby(result)]
+        elif compact:
+            """drop the dicts one after another while collecting the rows"""
+            rows = set()
+            while result != []:
+                answer_dict = result.pop()
+                rows.add(tuple([answer_dict[var] for var in varlist]))
+            """sorted once — ResultTable() would copy the set again"""
+            table = _result_table_(varlist, sorted(rows))
+            del rows
+            return table
         else:
             result = sorted(result)
             return [k for k,v in itertools.groupby(result)]
 
+    def _kind_of_types_(self, value, types):
+        """kind of python-type for a constant of the flora-types (list or printed list)"""
+        if '_integer' in types:
+            return 'int'
+        elif '_decimal' in types:
+            return 'float'
+        elif '_none' in types:
+            return 'none'
+        elif '_escaped' in types:
+            return 'escaped'
+        elif '_list' in types and value[0] == '[' and value[-1] == ']':
+            return 'list'
+        return 'str'
+
+    def _convert_kind_(self, value, kind):
+        """cast an answer to the kind of python-type calculated by format_result"""
+        if kind == 'int':
+            return int(value)
+        elif kind == 'float':
+            return float(value)
+        elif kind == 'none':
+            return None
+        elif kind == 'escaped':
+            return self.unescape(value)
+        elif kind == 'list':
+            return str2list(value)  # content of list is not casted now
+        return value
+
+    def _cache_type_(self, value, kind):
+        if len(self.type_cache) > 100000:
+            self.type_cache.clear()
+        self.type_cache[value] = kind
+
+    def _convert_known_types_(self, result, var, verbose=False):
+        """convert var in all answers — types of constants neither cached nor
+        recognizable by their syntax are asked from the engine in one query"""
+        unknown = set([answer_dict[var] for answer_dict in result])
+        unknown = [value for value in unknown \
+                   if guess_type_of_literal(value) == None and value not in self.type_cache]
+        if unknown != []:
+            self._query_types_(unknown, verbose)
+        converted = []
+        for answer_dict in result:
+            value = answer_dict[var]
+            kind = guess_type_of_literal(value) or self.type_cache.get(value, 'str')
+            answer_dict = answer_dict.copy()
+            answer_dict[var] = self._convert_kind_(value, kind)
+            converted.append(answer_dict)
+        return converted
+
+    def _query_types_(self, constants, verbose=False, batchsize=500):
+        """fill type_cache for the constants — without running the goal they are answers of again
+        Anonymous objects (like py2f(None)) can't be referenced by their printed name,
+        they are found by the members of _none."""
+        if verbose:
+            print '[types of ' + str(len(constants)) + ' constants]'
+        types = {}
+        quotable = [value for value in constants if "'" not in value]
+        for start in range(0, len(quotable), batchsize):
+            alternatives = ["?C = ''" + value + "''" for value in quotable[start:start + batchsize]]
+            for answer_dict in self.query('(' + ' ; '.join(alternatives) + '), ?C:?T.', ['C', 'T']):
+                types.setdefault(answer_dict['C'], []).append(answer_dict['T'])
+        if len(types) < len(constants):
+            for answer_dict in self.query('?C:_none.', ['C']):
+                types.setdefault(answer_dict['C'], []).append('_none')
+        for value in constants:
+            self._cache_type_(value, self._kind_of_types_(value, types.get(value, [])))
+
     def modifykb(self, expr, action=None, verbose=False, vverbose=False):
         """modify the knowledge-base (insert|delete[all])(fact|rule)"""
 
         if vverbose:
             verbose = True
+        self.type_cache.clear()
+        self._update_kb_hash_('modifykb', expr, action)
 
         """complete expression"""
         expr = self._uncomment_(expr)
@@ -201,6 +385,183 @@ class Flora2(rp.interface.Flora2):
                 print '[' + action + clause_type + ']'
         self.query(cmd, [])
 
+    def modifykb_batch(self, exprs, action='insert', batchsize=500, verbose=False, vverbose=False):
+        """insert|delete many facts or many rules with one engine-call per batch: insert{a, b, …}"""
+        exprs = [self._uncomment_(expr) for expr in exprs]
+        assert action in ['insert', 'delete'], 'Action not allowed'
+        rules = [re.match('.*:-.*', expr) != None for expr in exprs]
+        assert len(set(rules)) <= 1, 'Facts and rules can not be mixed within a batch'
+        if True in rules:
+            exprs = ['(' + expr + ')' for expr in exprs]
+
+        for start in range(0, len(exprs), batchsize):
+            self.modifykb(', '.join(exprs[start:start+batchsize]), action, verbose, vverbose)
+
+    def sync_facts(self, pattern, desired, verbose=False, vverbose=False):
+        """make the extension of pattern equal to the desired facts with minimal changes
+
+        desired is an iterable of value-tuples (single values for one variable), one value
+        for each variable in order of their first occurrence in pattern.
+        Values are flora-syntax strings or python-objects (translated by py2f).
+        Facts are compared by their values decoded with parse_term and removed facts are
+        written with quote_term — the answers printed by the engine are no flora-syntax.
+        Returns the counts of added, removed and unchanged facts.
+
+        >>> f = Flora2()
+        >>> f.sync_facts('s(?A, ?B)', [(1, 'a'), (2, 'b')])
+        {'removed': 0, 'added': 2, 'unchanged': 0}
+        >>> f.sync_facts('s(?A, ?B)', [(2, 'b'), (3, 'c')], verbose=True)
+        [refresh: s(?A, ?B)]
+        [query for ['A', 'B']]
+        [delete]
+        [insert]
+        {'removed': 1, 'added': 1, 'unchanged': 1}
+        >>> f.query_advanced('s(?A, ?B)')
+        [{'A': '2', 'B': 'b'}, {'A': '3', 'B': 'c'}]
+        >>> f.sync_facts('s(?A, ?B)', [(2, 'b'), (3, "''x y''")])
+        {'removed': 1, 'added': 1, 'unchanged': 1}
+        >>> f.sync_facts('s(?A, ?B)', [(2, 'b'), (3, "''x y''")])
+        {'removed': 0, 'added': 0, 'unchanged': 2}
+        >>> f.query_advanced('s(?A, ?B)')
+        [{'A': '2', 'B': 'b'}, {'A': '3', 'B': 'x y'}]
+        >>> f.sync_facts('s(?A, ?B)', [(2, 'b'), (4, None)])
+        {'removed': 1, 'added': 1, 'unchanged': 1}
+        >>> f.sync_facts('s(?A, ?B)', [(2, 'b'), (4, None)])
+        {'removed': 0, 'added': 0, 'unchanged': 2}
+        >>> f.sync_facts('s(?A, ?B)', [(2, 'b')])
+        {'removed': 1, 'added': 0, 'unchanged': 1}
+        >>> f.query_advanced('s(?A, ?B)')
+        [{'A': '2', 'B': 'b'}]
+        """
+        var_regex = '\?(?P<var>[A-Z][a-zA-Z0-9_]*)'
+        varlist = []
+        for match in re.finditer(var_regex, pattern):
+            if match.group('var') not in varlist:
+                varlist.append(match.group('var'))
+        assert varlist != [], 'Pattern without variables: ' + pattern
+
+        decode = lambda value: parse_term(value, strict=False)
+
+        """current extension — queried once
+        Members of _none (py2f(None)) are anonymous objects: their printed names can't be
+        written back, so they are compared as None and deleted by their class."""
+        (result, _) = self.query_advanced(pattern, varlist=varlist[:], formatResult=False, \
+                                          verbose=verbose, vverbose=vverbose)
+        result = [tuple([answer_dict[var] for var in varlist]) for answer_dict in result]
+        unknown = set([value for values in result for value in values \
+                       if guess_type_of_literal(value) == None and value not in self.type_cache])
+        if unknown:
+            self._query_types_(list(unknown), verbose)
+        current = {}
+        for values in result:
+            values = tuple([None if self.type_cache.get(value) == 'none' else decode(value) for value in values])
+            current[repr(values)] = values
+
+        """desired facts"""
+        wanted = {}
+        for values in desired:
+            if type(values) != type(()):
+                values = (values,)
+            assert len(values) == len(varlist), 'Expected values for ' + str(varlist) + ': ' + str(values)
+            values = tuple([value if type(value) in [type(''), type(u'')] else self.py2f(value)
+                            for value in values])
+            """the quotes of flora-syntax are doubled here, but not within the answers"""
+            key = tuple([None if value == self.py2f(None) else decode(value.replace("''", "'")) \
+                         for value in values])
+            wanted[repr(key)] = values
+
+        """apply the difference"""
+        instantiate = lambda values: re.sub(var_regex, lambda match: values[varlist.index(match.group('var'))], \
+                                            self._uncomment_(pattern))
+        removed = [current[key] for key in current if key not in wanted]
+        added = sorted([instantiate(wanted[key]) for key in wanted if key not in current])
+        self.modifykb_batch(sorted([instantiate([quote_term(value) for value in values]) \
+                                    for values in removed if None not in values]), \
+                            'delete', verbose=verbose, vverbose=vverbose)
+        for values in removed:
+            if None in values:
+                nones = ['?_None' + str(nr) for nr in range(len(values)) if values[nr] == None]
+                fact = instantiate([value == None and '?_None' + str(nr) or quote_term(value) \
+                                    for (nr, value) in enumerate(values)])
+                self.modifykb(fact + ' | ' + ', '.join([none + ':_none' for none in nones]), 'delete', \
+                              verbose, vverbose)
+        self.modifykb_batch(added, 'insert', verbose=verbose, vverbose=vverbose)
+
+        return {'added': len(added), 'removed': len(removed), 'unchanged': len(current) - len(removed)}
+
+    def aggregate(self, aggregate, goal, var=None, by=None, verbose=False, vverbose=False):
+        """calculate an aggregate within the engine, like getTypeOf builds a collectset{}:
+        ?Aggregate = count{ ?X | goal }   or grouped by ?G:   ?Aggregate = count{ ?X[?G] | goal }
+        var defaults to the first variable of goal. Returns a typed value (None if the aggregate fails)
+        or with „by“ a dict: value of by -> aggregate.
+
+        >>> f = Flora2()
+        >>> f.auto('++ salary(anna, it, 10)'); f.auto('++ salary(bob, it, 20)'); f.auto('++ salary(carl, hr, 15)')
+        >>> f.count('salary(?P, ?_, ?_)')
+        3
+        >>> f.sum('salary(?_, ?_, ?S)')
+        45
+        >>> f.avg('salary(?P, ?D, ?S)', var='S', verbose=True)
+        [refresh: salary(?P, ?D, ?S)]
+        [query for ['Aggregate']]
+        15.0
+        >>> f.max('salary(?_, it, ?S)'), f.min('salary(?_, none, ?S)')
+        (20, None)
+        >>> f.group_by('salary(?P, ?D, ?S)', 'D', var='S', aggregate='sum')
+        {'hr': 15, 'it': 30}
+        >>> f.auto('++ salary(dora, hr, 5)')
+        >>> f.count('salary(?P, ?_, ?_)'), f.group_by('salary(?P, ?D, ?_)', 'D')
+        (4, {'hr': 2, 'it': 2})
+        """
+        assert aggregate in ['count', 'sum', 'min', 'max', 'avg'], 'Aggregate not allowed: ' + aggregate
+        goal = self._uncomment_(goal)
+        variables = [match.group('var') for match in re.finditer('\?(?P<var>[A-Za-z][a-zA-Z0-9_]*)', goal)]
+        assert 'Aggregate' not in variables, '?Aggregate is used for the result'
+        if var == None:
+            assert variables != [], 'Goal without variables: ' + goal
+            var = variables[0]
+        var = var.lstrip('?')
+        """the aggregate can't be refreshed, but the goal within"""
+        self._refresh_(goal, verbose or vverbose)
+
+        if by == None:
+            expr = '?Aggregate = ' + aggregate + '{ ?' + var + ' | ' + goal + ' }'
+            result = self.query_advanced(expr, varlist=['Aggregate'], convertTypeOf=['Aggregate'], \
+                                         verbose=verbose, vverbose=vverbose, refresh=False)
+            if result == []:
+                return None
+            return result[0]
+
+        by = by.lstrip('?')
+        expr = '?Aggregate = ' + aggregate + '{ ?' + var + '[?' + by + '] | ' + goal + ' }'
+        result = self.query_advanced(expr, varlist=[by, 'Aggregate'], convertTypeOf=['Aggregate'], \
+                                     verbose=verbose, vverbose=vverbose, refresh=False)
+        return dict([(answer_dict[by], answer_dict['Aggregate']) for answer_dict in result])
+
+    def count(self, goal, var=None, **kwargs):
+        """number of answers of goal (see aggregate)"""
+        return self.aggregate('count', goal, var, **kwargs)
+
+    def sum(self, goal, var=None, **kwargs):
+        """sum of var over the answers of goal (see aggregate)"""
+        return self.aggregate('sum', goal, var, **kwargs)
+
+    def min(self, goal, var=None, **kwargs):
+        """minimum of var over the answers of goal (see aggregate)"""
+        return self.aggregate('min', goal, var, **kwargs)
+
+    def max(self, goal, var=None, **kwargs):
+        """maximum of var over the answers of goal (see aggregate)"""
+        return self.aggregate('max', goal, var, **kwargs)
+
+    def avg(self, goal, var=None, **kwargs):
+        """average of var over the answers of goal (see aggregate)"""
+        return self.aggregate('avg', goal, var, **kwargs)
+
+    def group_by(self, goal, by, var=None, aggregate='count', **kwargs):
+        """dict: each value of by -> aggregate of var over the answers of goal (see aggregate)"""
+        return self.aggregate(aggregate, goal, var, by, **kwargs)
+
     def auto(self, expr, **kwargs):
         """query or modifykb depending on parsing result"""
         expr = expr.strip()
@@ -222,6 +583,8 @@ class Flora2(rp.interface.Flora2):
         assert os.path.isdir(dirname), 'Dir not existing: ' + dirname
         assert os.path.isfile(filename), 'File not existing: ' + filename
 
+        self.type_cache.clear()
+        self._update_kb_hash_('consult', module, add, open(filename, 'r').read())
         orig_dir = os.getcwd()
         os.chdir(dirname)
 
@@ -236,7 +599,7 @@ class Flora2(rp.interface.Flora2):
 
     def consult_dir(self, dirname, add=True, **kwargs):
         """load all flora-files from directory"""
-        for filename in os.listdir(dirname):
+        for filename in sorted(os.listdir(dirname)):  # same order — same kb_hash
             if os.path.splitext(filename)[1] == '.flr':
                 self.consult(dirname + os.path.sep + filename, add=add, **kwargs)
                 add = True  # after first file all others are added
@@ -299,6 +662,11 @@ class Flora2(rp.interface.Flora2):
                 return "''" + obj + "''"
             else:
                 return self.escape(obj)
+        if rp == None:
+            """replayed sessions: numbers and lists written like rp does"""
+            if type(obj) in [type([]), type(())]:
+                return '[' + ', '.join([self.py2f(item) for item in obj]) + ']'
+            return str(obj)
         return rp.py2f().translate(obj)
 
 class InsecureVariable(TypeError):
@@ -402,6 +770,16 @@ def comperator(x, y):
     return result / abs(result)
 
 
+_whitespace_or_quoted_ = re.compile(r"(?P<quoted>''(?:[^']|'''')*''|'(?:[^']|'')*'|" \
+                                    + r'"(?:[^"\\]|\\.)*")|\s+')
+
+def normalize_whitespace(expr):
+    r"""collapse whitespace outside of quotes (e.g. for the keys of query_cache)
+    >>> print normalize_whitespace('p( ?X,\n  "a  b", \'\'c  d\'\',  \'e  f\' )')
+    p( ?X, "a  b", ''c  d'', 'e  f' )
+    """
+    return _whitespace_or_quoted_.sub(lambda match: match.group('quoted') or ' ', expr)
+
 def str2list(string):
     result = [val.strip() for val in string[1:-1].split(',')]
     if '' in result:
@@ -0,0 +1,321 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+python-side representation of flora-answers (used by rpsimple)
+
+* parse_term decodes answers into nested lists/tuples/Terms with typed constants
+* ResultTable is the compact result of queries with several vars
+* guess_type_of_literal recognizes types by the syntax of an answer
+* quote_term writes decoded values back in flora-syntax
+* Pager returns results page by page (query_advanced with limit, more)
+
+This module does not need XSB/Flora2, so also clients of rpdaemon can use it.
+"""
+
+import doctest
+import re
+import sys
+
+
+def guess_type_of_literal(string):
+    """kind of python-type (see Flora2.format_result) recognizable by the syntax of an answer — or None
+    >>> [guess_type_of_literal(s) for s in ['23', '-4.2', '[a, b]', "'x y'", 'object']]
+    ['int', 'float', 'list', 'str', None]
+    """
+    if _term_int_.match(string):
+        return 'int'
+    elif _term_float_.match(string):
+        return 'float'
+    elif len(string) >= 2 and string[0] == '[' and string[-1] == ']':
+        return 'list'
+    elif len(string) >= 2 and string[0] == string[-1] and string[0] in ['"', "'"]:
+        return 'str'
+    return None
+
+
+class Term(object):
+    """compound term as decoded by parse_term: functor(args…)
+    >>> Term('f', ('a', 1)) == parse_term('f(a, 1)')
+    True
+    """
+    __slots__ = ('functor', 'args')
+
+    def __init__(self, functor, args):
+        self.functor = functor
+        self.args = tuple(args)
+
+    def __eq__(self, other):
+        return isinstance(other, Term) and (self.functor, self.args) == (other.functor, other.args)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.functor, self.args))
+
+    def __repr__(self):
+        return 'Term(' + repr(self.functor) + ', ' + repr(self.args) + ')'
+
+
+class ResultTable(object):
+    """compact result of a query with several vars: the header (names of vars) is shared,
+    the answers are stored as tuples — deduplicated by hashing and sorted.
+    The rows are a sorted list in memory (not lazy), only the dicts per answer are saved.
+    >>> table = ResultTable(['A', 'B'], [('2', 'b'), ('1', 'a'), ('2', 'b')])
+    >>> table
+    ResultTable(['A', 'B'], 2 rows)
+    >>> list(table)
+    [('1', 'a'), ('2', 'b')]
+    >>> table[1:].to_dicts()
+    [{'A': '2', 'B': 'b'}]
+    >>> table = ResultTable(['B', 'A'], [('b', '1'), ('a', '2')])
+    >>> table.to_dicts() == sorted([{'B': 'b', 'A': '1'}, {'B': 'a', 'A': '2'}])
+    True
+    """
+    __slots__ = ('header', 'rows')
+
+    def __init__(self, header, rows):
+        self.header = list(header)
+        self.rows = sorted(set(rows))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __getitem__(self, index):
+        if type(index) == type(slice(0)):
+            return _result_table_(self.header, self.rows[index])
+        return self.rows[index]
+
+    def __eq__(self, other):
+        return isinstance(other, ResultTable) and (self.header, self.rows) == (other.header, other.rows)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'ResultTable(' + repr(self.header) + ', ' + str(len(self.rows)) + ' rows)'
+
+    def column(self, var):
+        """all values of one var"""
+        idx = self.header.index(var)
+        return [row[idx] for row in self.rows]
+
+    def iterdicts(self):
+        """answers as dicts, created one after another (in order of the rows)"""
+        for row in self.rows:
+            yield dict(zip(self.header, row))
+
+    def to_dicts(self):
+        """answers as list of dicts — in the same order as format_result without compact"""
+        return sorted(self.iterdicts())
+
+
+def _result_table_(header, rows):
+    """ResultTable of rows already deduplicated and sorted (e.g. sent by rpdaemon)"""
+    table = ResultTable.__new__(ResultTable)
+    table.header = list(header)
+    table.rows = rows
+    return table
+
+
+class Pager(object):
+    """mixin keeping the answers of the last query run with limit, so more() returns the
+    following pages without running it again — each Flora2 / Flora2Client has its own
+    >>> pager = Pager()
+    >>> pager._page_(['1', '2', '3'], 2, 0, verbose=True)
+    [answers 0-2 of 3]
+    ['1', '2']
+    >>> pager.more(), pager.more()
+    (['3'], [])
+    """
+
+    def _page_(self, result, limit, offset, verbose=False):
+        """return one page of result, remember the rest for more()"""
+        if limit == None or type(result) == type(True):
+            return result
+        self.last_pages = {'result': result, 'offset': offset + limit, 'limit': limit}
+        if verbose:
+            print '[answers ' + str(offset) + '-' + str(min(offset + limit, len(result))) + \
+                  ' of ' + str(len(result)) + ']'
+        return result[offset:offset + limit]
+
+    def more(self, limit=None, verbose=False):
+        """next page of the last query run with limit"""
+        assert hasattr(self, 'last_pages'), 'No query with limit run before'
+        pages = self.last_pages
+        if limit == None:
+            limit = pages['limit']
+        return self._page_(pages['result'], limit, pages['offset'], verbose)
+
+
+_term_tokens_ = re.compile(r"""\s*(?:(?P<quoted>'(?:[^']|'')*')"""
+                           r"""|(?P<dquoted>"(?:[^"\\]|\\.)*")"""
+                           r"""|(?P<punct>[()\[\],|])"""
+                           r"""|(?P<atom>[^\s()\[\],|'"]+)"""
+                           r"""|(?P<error>\S))""")
+_term_int_ = re.compile('^[-+]?[0-9]+$')
+_term_float_ = re.compile('^[-+]?[0-9]+[.][0-9]+([eE][-+]?[0-9]+)?$')
+_term_delimiters_ = [',', ')', ']', '|', None]
+_term_const_cache_ = {}
+
+def _decode_const_(kind, text):
+    """typed value of a constant token (cached, since the same constants keep coming back)"""
+    try:
+        return _term_const_cache_[text]
+    except KeyError:
+        pass
+    if kind == 'quoted':
+        value = text[1:-1].replace("''", "'")
+    elif kind == 'dquoted':
+        value = text[1:-1].decode('string_escape')
+    elif _term_int_.match(text):
+        value = int(text)
+    elif _term_float_.match(text):
+        value = float(text)
+    else:
+        value = text
+    if len(_term_const_cache_) > 100000:
+        _term_const_cache_.clear()
+    _term_const_cache_[text] = value
+    return value
+
+def parse_term(string, strict=True):
+    r"""decode a flora-answer into (nested) python-objects in a single pass:
+    lists -> list, (a,b) -> tuple, compounds -> Term, numbers -> int|float, atoms&strings -> str
+    Operator-expressions (like „1 + 2“) are kept as string.
+    Values already decoded (e.g. by convertTypeOf) are returned unchanged, lists decoded itemwise.
+    The engine prints atoms without quotes, so answers like „it's“ can't be parsed —
+    with strict=False they are returned as string instead of raising.
+    >>> parse_term('[f(a,b), [1,2], 3.5]')
+    [Term('f', ('a', 'b')), [1, 2], 3.5]
+    >>> parse_term("['quoted, with '' inside', \"foo\", (x, y), [], -7]")
+    ["quoted, with ' inside", 'foo', ('x', 'y'), [], -7]
+    >>> parse_term('g(1 + 2, [a|b], [a|[b, c]])')
+    Term('g', ('1 + 2', Term('|', (['a'], 'b')), ['a', 'b', 'c']))
+    >>> parse_term('42')
+    42
+    >>> parse_term(r'["a\"b", "c\\d"]')
+    ['a"b', 'c\\d']
+    >>> parse_term(42), parse_term(['1', 'x'])
+    (42, [1, 'x'])
+    >>> parse_term('1 + (2')
+    Traceback (most recent call last):
+    ...
+    AssertionError: Unbalanced brackets in: 1 + (2
+    >>> parse_term("it's", strict=False), parse_term(['f(x)', 'say "hi'], strict=False)
+    ("it's", [Term('f', ('x',)), 'say "hi'])
+    """
+    if type(string) == type([]):
+        return [parse_term(item, strict) for item in string]
+    elif type(string) not in [type(''), type(u'')]:
+        return string
+    elif not strict:
+        try:
+            return parse_term(string)
+        except AssertionError:
+            return string
+
+    tokens = []
+    for match in _term_tokens_.finditer(string):
+        kind = match.lastgroup
+        assert kind != 'error', 'Can not parse „' + match.group(kind) + '“ in: ' + string
+        tokens.append((kind, match.group(kind), match.start(kind), match.end(kind)))
+    tokens.append((None, None, len(string), len(string)))
+
+    def parse_args(pos, close):
+        """parse „term, term, …“ till close, returns (list, tail, pos)"""
+        args = []
+        tail = None
+        if tokens[pos][1] == close:
+            return (args, tail, pos + 1)
+        while True:
+            (arg, pos) = parse(pos)
+            args.append(arg)
+            if tokens[pos][1] == ',':
+                pos += 1
+            elif tokens[pos][1] == '|' and close == ']' and tail == None:
+                (tail, pos) = parse(pos + 1)
+                assert tokens[pos][1] == close, 'Expected „' + close + '“ in: ' + string
+                return (args, tail, pos + 1)
+            else:
+                assert tokens[pos][1] == close, 'Expected „' + close + '“ in: ' + string
+                return (args, tail, pos + 1)
+
+    def parse(pos):
+        """parse one term starting at token pos, returns (value, pos)"""
+        start = pos
+        (kind, text, begin, end) = tokens[pos]
+        if text == '[':
+            (value, tail, pos) = parse_args(pos + 1, ']')
+            if type(tail) == type([]):
+                value += tail
+            elif tail != None:
+                value = Term('|', (value, tail))
+        elif text == '(':
+            (value, tail, pos) = parse_args(pos + 1, ')')
+            if len(value) == 1:
+                value = value[0]
+            else:
+                value = tuple(value)
+        else:
+            assert kind in ['atom', 'quoted', 'dquoted'], 'Unexpected „' + str(text) + '“ in: ' + string
+            pos += 1
+            if tokens[pos][1] == '(' and tokens[pos][2] == end:
+                (args, tail, pos) = parse_args(pos + 1, ')')
+                if kind == 'atom':
+                    value = Term(text, args)
+                else:
+                    value = Term(_decode_const_(kind, text), args)
+            else:
+                value = _decode_const_(kind, text)
+
+        """operator-syntax: keep the whole expression as string"""
+        if tokens[pos][1] not in _term_delimiters_:
+            depth = 0
+            while depth != 0 or tokens[pos][1] not in _term_delimiters_:
+                assert tokens[pos][0] != None, 'Unbalanced brackets in: ' + string
+                if tokens[pos][1] in ['(', '[']:
+                    depth += 1
+                elif tokens[pos][1] in [')', ']']:
+                    depth -= 1
+                pos += 1
+            value = string[tokens[start][2]:tokens[pos - 1][3]]
+        return (value, pos)
+
+    (value, pos) = parse(0)
+    assert tokens[pos][0] == None, 'Unexpected „' + str(tokens[pos][1]) + '“ in: ' + string
+    return value
+
+
+_term_plain_atom_ = re.compile('^[a-z][a-zA-Z0-9_]*$')
+
+def quote_term(value):
+    """flora-syntax of a value decoded by parse_term (quotes doubled like everywhere in rpsimple)
+    >>> print quote_term([Term('f', ('a', 1)), 'x y', "it's", (2.5, []), Term('|', (['a'], 'b'))])
+    [f(a, 1), ''x y'', ''it''''s'', (2.5, []), [a|b]]
+    >>> parse_term(quote_term(parse_term('g(x, [1, 2|y])')).replace("''", "'"))
+    Term('g', ('x', Term('|', ([1, 2], 'y'))))
+    """
+    if isinstance(value, Term):
+        if value.functor == '|' and len(value.args) == 2 and type(value.args[0]) == type([]):
+            return '[' + ', '.join([quote_term(item) for item in value.args[0]]) + '|' \
+                   + quote_term(value.args[1]) + ']'
+        return quote_term(value.functor) + '(' + ', '.join([quote_term(arg) for arg in value.args]) + ')'
+    elif type(value) == type([]):
+        return '[' + ', '.join([quote_term(item) for item in value]) + ']'
+    elif type(value) == type(()):
+        return '(' + ', '.join([quote_term(item) for item in value]) + ')'
+    elif type(value) in [type(''), type(u'')]:
+        if _term_plain_atom_.match(value):
+            return value
+        return "''" + value.replace("'", "''''") + "''"
+    return str(value)
+
+
+if __name__ == '__main__':
+    result = doctest.testmod()
+    print result
+    sys.exit(result.failed)
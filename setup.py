@@ -17,7 +17,8 @@ setup(name='ipy_flora',
       author_email='github_donotspam_at_johannesloetzsch.de',
       description = open('README').readline().strip(),
       long_description = ''.join(open('README').readlines()[1:]).strip(),
-      py_modules = [ 'ipy_flora.rpsimple', 'ipy_flora.ipy_flora' ]
+      py_modules = [ 'ipy_flora.rpsimple', 'ipy_flora.rpterms', 'ipy_flora.ipy_flora', 'ipy_flora.rpdaemon',
+                     'ipy_flora.rpreplay', 'ipy_flora.rpcache' ]
 	 )
 
 """test if everything works"""
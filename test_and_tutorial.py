@@ -170,7 +170,7 @@ def r( cmd ):
 if __name__ == '__main__':
     print 'Run Selftest…'
 
-    for test in ['rpsimple', 'ipy_flora']:
+    for test in ['rpterms', 'rpsimple', 'ipy_flora', 'rpdaemon', 'rpreplay', 'rpcache']:
         print '\n===test ' + test + '==='
         failed = subprocess.call('./ipy_flora/' + test + '.py')
         assert failed == 0, 'Error while testing of ' + test + '\n' \